@@ -1,15 +1,32 @@
 import os
+import re
 import logging
-import tempfile
+import hashlib
+import atexit
+import gc
+import queue
+import threading
+import time
+from functools import lru_cache
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from pymongo import MongoClient
+import orjson
+from pymongo import MongoClient, ASCENDING, DESCENDING
 import base64
 import io
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from bson import ObjectId
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
-from weasyprint import HTML
-# from whitenoise import WhiteNoise  # ❌ Not needed in Render/Docker environment
+from bson.binary import Binary
+from flask import Flask, Response, render_template, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
+from jinja2 import FileSystemBytecodeCache
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+from whitenoise import WhiteNoise
+from catalog import CSV_PATH, load_catalog
 
 # MongoDB connection setup
 from dotenv import load_dotenv
@@ -17,141 +34,382 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB")
 
-client = MongoClient(MONGO_URI)
+# connect=False: no sockets/monitor threads until first use, so forked gunicorn workers
+# (--preload) each open their own connections
+client = MongoClient(MONGO_URI, connect=False)
 db = client[MONGO_DB]
 pdf_collection = db["prescriptions"]  # new collection
 
 # -------------------------
 # App Configuration
 # -------------------------
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON (request.get_json, jsonify) backed by orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__, static_folder='static', static_url_path='/static')
-# app.wsgi_app = WhiteNoise(app.wsgi_app, root='static/', prefix='static/')  # Commented for Docker
+app.json = OrjsonProvider(app)
+
+# ✅ Compress JSON and the landing page (static files are precompressed by WhiteNoise)
+app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+app.config['COMPRESS_LEVEL'] = 4
+Compress(app)
+
+# ✅ WhiteNoise owns /static/: files are indexed once at startup and precompressed
+# .gz/.br variants (see Dockerfile) are served as-is. Asset URLs carry no content hash,
+# so keep WhiteNoise's short default max_age and let browsers pick up deploys quickly.
+app.wsgi_app = WhiteNoise(
+    app.wsgi_app,
+    root=os.path.join(app.root_path, 'static'),
+    prefix='static/',
+    autorefresh=False
+)
+
+# ✅ Templates are static in production: no mtime checks, cached bytecode
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+app.jinja_env.auto_reload = False
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+PRESCRIPTION_TEMPLATE = app.jinja_env.get_template('prescription.html')
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
 # -------------------------
-# Serve static files manually (extra fallback)
-# -------------------------
-@app.route('/static/<path:filename>')
-def staticfiles(filename):
-    return send_from_directory(app.static_folder, filename)
-
-# -------------------------
-# Load and clean CSV data
+# Warm up WeasyPrint (font discovery / Pango setup) once per process
 # -------------------------
+FONT_CONFIG = FontConfiguration()
+# ✅ Parsed once and shared by every render
+PRESCRIPTION_CSS = CSS(
+    filename=os.path.join(app.root_path, 'static', 'css', 'prescription-style.css'),
+    font_config=FONT_CONFIG
+)
 try:
-    csv_path = os.path.join(os.path.dirname(__file__), "medicines.csv")
+    HTML(string='<p>warmup</p>').write_pdf(stylesheets=[PRESCRIPTION_CSS], font_config=FONT_CONFIG)
+except Exception as e:
+    logger.warning(f"⚠️ WeasyPrint warm-up failed: {e}")
 
-    if not os.path.exists(csv_path):
-        raise FileNotFoundError("❌ medicines.csv file not found in root folder")
+# ✅ WeasyPrint is CPU-bound; render in worker processes so request threads stay free.
+# Created lazily per process: a pool built before gunicorn forks would share its pipes.
+_pdf_pool_lock = threading.Lock()
+_pdf_pool = None
 
-    df = pd.read_csv(csv_path)
 
-    # ✅ Clean Price (handles various messy formats)
-    df['Price_Clean'] = (
-        df['Price']
-        .astype(str)
-        .str.replace(r'.*?:\s*৳\s*', '', regex=True)
-        .str.replace(r'[^\d\.]', '', regex=True)
-        .replace('', '0')
-    )
+def get_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+        return _pdf_pool
 
-    # ✅ Fix multi-dot numbers like "10.256.00"
-    df['Price_Clean'] = df['Price_Clean'].apply(
-        lambda x: x if x.count('.') <= 1 else x[:x.find('.', x.find('.') + 1)]
-    )
 
-    df['Price_Clean'] = pd.to_numeric(df['Price_Clean'], errors='coerce').fillna(0.0)
+def _discard_pdf_pool(pool):
+    # A render process died (OOM kill, crash): the executor is unusable from now on
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
 
-    # ✅ Drop rows with missing Strength
-    df_cleaned = df.dropna(subset=['Strength']).copy()
+def _reset_pdf_pool_after_fork():
+    global _pdf_pool, _pdf_pool_lock
+    _pdf_pool = None
+    _pdf_pool_lock = threading.Lock()
 
-    # ✅ Normalize text columns
-    df_cleaned['Generic_Clean'] = df_cleaned['Generic'].astype(str).str.strip().str.lower()
-    df_cleaned['Strength'] = df_cleaned['Strength'].astype(str).str.strip()
-    df_cleaned['Type'] = df_cleaned['Type'].astype(str).str.strip()
 
-    logger.info(f"✅ Loaded {len(df_cleaned)} medicines from local CSV successfully.")
+os.register_at_fork(after_in_child=_reset_pdf_pool_after_fork)
+
+# -------------------------
+# Batched MongoDB writes for generated PDFs (kept off the request path)
+# -------------------------
+PDF_WRITE_QUEUE = queue.Queue()
+PDF_WRITE_BATCH_SIZE = 20
+PDF_WRITE_INTERVAL = 2.0  # seconds to wait for more documents before flushing
+PDF_WRITER_SHUTDOWN_TIMEOUT = 30.0  # seconds to let the writer finish its batch at exit
+_PDF_WRITER_STOP = object()  # queue sentinel: write the current batch, then exit
+_pdf_writer_lock = threading.Lock()
+_pdf_writer_thread = None
+
+
+def _drain_pdf_batch(first_doc, deadline):
+    """Collect a batch after first_doc; also reports whether the stop sentinel arrived."""
+    batch = [first_doc]
+    while len(batch) < PDF_WRITE_BATCH_SIZE:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            doc = PDF_WRITE_QUEUE.get(timeout=timeout)
+        except queue.Empty:
+            break
+        if doc is _PDF_WRITER_STOP:
+            return batch, True
+        batch.append(doc)
+    return batch, False
+
+
+def _insert_pdf_batch(batch):
+    try:
+        pdf_collection.insert_many(batch, ordered=False)
+    except Exception as e:
+        logger.error(f"❌ Failed to save {len(batch)} prescription PDF(s) to MongoDB: {e}")
+
+
+def _ensure_pdf_indexes():
+    # ✅ Match the prescription lookups (newest first, per patient); idempotent on the server
+    try:
+        pdf_collection.create_index([("created_at", DESCENDING)])
+        pdf_collection.create_index([("patient_name", ASCENDING), ("created_at", DESCENDING)])
+    except Exception as e:
+        logger.warning(f"⚠️ Could not create prescription indexes: {e}")
+
+
+def _pdf_writer():
+    _ensure_pdf_indexes()
+    while True:
+        first_doc = PDF_WRITE_QUEUE.get()
+        if first_doc is _PDF_WRITER_STOP:
+            return
+        batch, stop = _drain_pdf_batch(first_doc, time.monotonic() + PDF_WRITE_INTERVAL)
+        _insert_pdf_batch(batch)
+        if stop:
+            return
+
+
+def enqueue_pdf_doc(pdf_doc):
+    """Queue a prescription document; the writer thread is started lazily per process."""
+    global _pdf_writer_thread
+    with _pdf_writer_lock:
+        if _pdf_writer_thread is None or not _pdf_writer_thread.is_alive():
+            _pdf_writer_thread = threading.Thread(target=_pdf_writer, name="pdf-writer", daemon=True)
+            _pdf_writer_thread.start()
+    PDF_WRITE_QUEUE.put(pdf_doc)
+
+
+@atexit.register
+def _flush_pdf_writes():
+    # ✅ Let the writer finish the batch it already holds, then write anything still queued
+    writer = _pdf_writer_thread
+    if writer is not None and writer.is_alive():
+        PDF_WRITE_QUEUE.put(_PDF_WRITER_STOP)
+        writer.join(timeout=PDF_WRITER_SHUTDOWN_TIMEOUT)
+
+    batch = []
+    while True:
+        try:
+            doc = PDF_WRITE_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        if doc is not _PDF_WRITER_STOP:
+            batch.append(doc)
+    if batch:
+        _insert_pdf_batch(batch)
+
+# -------------------------
+# Load and clean CSV data
+# -------------------------
+try:
+    if not os.path.exists(CSV_PATH):
+        raise FileNotFoundError("❌ medicines.csv file not found in root folder")
+
+    df_cleaned = load_catalog(CSV_PATH)
+
+    # ✅ Lookups built once, so routes never scan the whole frame
+    by_generic = df_cleaned.groupby('Generic_Clean', sort=False, observed=True)
+    generic_strengths = by_generic['Strength'].unique()
+    generic_types = by_generic['Type'].unique()
+    OPTIONS_BY_GENERIC = {
+        gen: {
+            'strengths': sorted(generic_strengths[gen].dropna().tolist()),
+            'types': sorted(generic_types[gen].dropna().tolist()),
+        }
+        for gen in generic_strengths.index
+    }
+    # ✅ Ready-to-serialize get_details options per (generic, strength, type)
+    DETAILS_INDEX = {}
+    for key, generic, name, brand, price, price_raw, strength, drug_type in zip(
+        zip(df_cleaned['Generic_Clean'], df_cleaned['Strength'], df_cleaned['Type']),
+        df_cleaned['Generic_Clean'].astype(str).str.title().tolist(),
+        df_cleaned['Medicine Name'].tolist(),
+        df_cleaned['Brand'].tolist(),
+        np.char.add('৳ ', np.char.mod('%.2f', df_cleaned['Price_Clean'].to_numpy())).tolist(),
+        df_cleaned['Price_Clean'].tolist(),
+        df_cleaned['Strength'].astype(str).tolist(),
+        df_cleaned['Type'].astype(str).tolist(),
+    ):
+        DETAILS_INDEX.setdefault(key, []).append({
+            'generic': generic,
+            'medicine_name': name,
+            'brand': brand,
+            'price': price,
+            'price_raw': price_raw,
+            'strength': strength,
+            'type': drug_type,
+            'quantity': 1,
+            'time_schedule': "1+1+1",
+            'meal_time': "After Meal"
+        })
+    GENERIC_OPTIONS_TITLE = [g.title() for g in sorted(OPTIONS_BY_GENERIC)]
+
+    CATALOG_SIZE = len(df_cleaned)
+
+    # ✅ Requests are served from the indexes above; don't keep the frame resident
+    del df_cleaned, by_generic, generic_strengths, generic_types
+
+    logger.info(f"✅ Loaded {CATALOG_SIZE} medicines from local CSV successfully.")
 
 except Exception as e:
     logger.error(f"❌ Failed to load local CSV data: {e}")
-    df_cleaned = pd.DataFrame()
+    CATALOG_SIZE = 0
+    OPTIONS_BY_GENERIC = {}
+    DETAILS_INDEX = {}
+    GENERIC_OPTIONS_TITLE = []
+
+# ✅ Everything loaded so far is read-only; keep the GC from touching it so pages stay
+# shared with forked gunicorn workers (--preload)
+gc.collect()
+gc.freeze()
 
 # -------------------------
 # Routes
 # -------------------------
+@lru_cache(maxsize=1)
+def _index_html():
+    """Rendered landing page; it has no per-user state, so render it once."""
+    return render_template('index.html', generic_options=GENERIC_OPTIONS_TITLE)
+
+
 @app.route('/')
 def index():
-    if df_cleaned.empty:
+    if not CATALOG_SIZE:
         return render_template('index.html', error="Error: Could not load data from local CSV.")
 
-    generic_options = sorted(df_cleaned['Generic_Clean'].dropna().unique().tolist())
-    generic_options = [g.title() for g in generic_options]
-    return render_template('index.html', generic_options=generic_options)
+    return _index_html()
+
+
+# ✅ Option data only changes on redeploy, so browsers may reuse lookups for a while
+LOOKUP_MAX_AGE = 3600
+
+
+def _json_with_etag(obj):
+    payload = app.json.dumps(obj).encode('utf-8')
+    return payload, hashlib.md5(payload).hexdigest()
+
+
+def cached_json_response(payload, etag):
+    """Serve a pre-serialized lookup payload with ETag/Cache-Control (304 on a match)."""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = LOOKUP_MAX_AGE
+    return response
+
 
+def _lookup_params():
+    # GET query string (cacheable by browsers) or the original JSON POST body
+    if request.method == 'GET':
+        return request.args
+    return request.get_json(cache=False)
 
-@app.route('/get_options', methods=['POST'])
+
+@lru_cache(maxsize=4096)
+def _options_json(generic):
+    """Serialized /get_options payload and its ETag (data is read-only after load)."""
+    return _json_with_etag(OPTIONS_BY_GENERIC.get(generic, {'strengths': [], 'types': []}))
+
+
+@lru_cache(maxsize=4096)
+def _details_json(key):
+    """Serialized /get_details payload and its ETag for a known (generic, strength, type)."""
+    return _json_with_etag({'options': DETAILS_INDEX[key]})
+
+
+@app.route('/get_options', methods=['GET', 'POST'])
 def get_options():
     try:
-        data = request.get_json()
+        data = _lookup_params()
         generic = data.get('generic', '').strip().lower()
+        # ✅ Unknown generics share the empty entry, so arbitrary input can't churn the cache
+        if generic not in OPTIONS_BY_GENERIC:
+            generic = ''
 
-        if not generic:
-            return jsonify({'strengths': [], 'types': []})
-
-        filtered = df_cleaned[df_cleaned['Generic_Clean'] == generic]
-        strengths = sorted(filtered['Strength'].dropna().unique().tolist())
-        types = sorted(filtered['Type'].dropna().unique().tolist())
-
-        return jsonify({'strengths': strengths, 'types': types})
+        return cached_json_response(*_options_json(generic))
     except Exception as e:
         logger.error(f"Error in get_options: {e}")
         return jsonify({'error': 'Failed to fetch options'}), 500
 
 
-@app.route('/get_details', methods=['POST'])
+@app.route('/get_details', methods=['GET', 'POST'])
 def get_details():
     try:
-        data = request.get_json()
+        data = _lookup_params()
         generic = data.get('generic', '').strip().lower()
         strength = data.get('strength', '').strip()
         drug_type = data.get('type', '').strip()
 
-        df_filtered = df_cleaned[
-            (df_cleaned['Generic_Clean'] == generic)
-            & (df_cleaned['Strength'] == strength)
-            & (df_cleaned['Type'] == drug_type)
-        ].copy()
-
-        if df_filtered.empty:
+        key = (generic, strength, drug_type)
+        if key not in DETAILS_INDEX:
             return jsonify({'error': 'No brands found.'}), 404
 
-        options = []
-        for _, row in df_filtered.iterrows():
-            options.append({
-                'generic': row.get('Generic_Clean', '').title(),
-                'medicine_name': row.get('Medicine Name', ''),
-                'brand': row.get('Brand', ''),
-                'price': f"৳ {row['Price_Clean']:.2f}",
-                'price_raw': float(row['Price_Clean']),
-                'strength': row.get('Strength', ''),
-                'type': row.get('Type', ''),
-                'quantity': 1,
-                'time_schedule': "1+1+1",
-                'meal_time': "After Meal"
-            })
-
-        return jsonify({'options': options})
+        return cached_json_response(*_details_json(key))
     except Exception as e:
         logger.error(f"Error in get_details: {e}")
         return jsonify({'error': 'Failed to fetch medicine details'}), 500
 
 
+# ✅ Markup WeasyPrint would fetch/parse for nothing: scripts never run in a PDF and
+# prescription-style.css is handed to write_pdf() directly (user origin, so any
+# rule in the template's <style> block beats it; keep overrides there)
+PDF_UNUSED_ASSETS_RE = re.compile(
+    r'<script\b[^>]*>.*?</script>|<link\b[^>]*href="[^"]*prescription-style\.css"[^>]*>',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+@lru_cache(maxsize=32)
+def _fetch_remote_asset(url):
+    result = default_url_fetcher(url)
+    if 'file_obj' in result:
+        result['string'] = result.pop('file_obj').read()
+    return result
+
+
+def pdf_url_fetcher(url):
+    """Fetch remote assets (the CDN Font Awesome CSS and fonts) once per process."""
+    if url.startswith(('http://', 'https://')):
+        return dict(_fetch_remote_asset(url))
+    return default_url_fetcher(url)
+
+
+def _render_pdf_bytes(rendered_html, base_url):
+    """Render prescription HTML to PDF bytes (runs inside the PDF pool)."""
+    return HTML(string=rendered_html, base_url=base_url, url_fetcher=pdf_url_fetcher).write_pdf(
+        stylesheets=[PRESCRIPTION_CSS],
+        font_config=FONT_CONFIG
+    )
+
+
+def _num(value, conv):
+    """conv(value), or NaN when it can't be converted (the line then bills 0)."""
+    try:
+        return conv(value)
+    except (TypeError, ValueError, OverflowError):
+        return np.nan
+
+
 @app.route('/generate_pdf', methods=['POST'])
 def generate_pdf():
     try:
-        data = request.get_json(force=True)
+        data = request.get_json(force=True, cache=False)
         if isinstance(data, list):
             data = data[0] if data else {}
 
@@ -167,17 +425,17 @@ def generate_pdf():
         next_appointment = data.get('next_appointment', 'As Advised')
         current_date = datetime.now().strftime('%d-%m-%Y')
 
-        total_cost = 0
-        for m in medicines:
-            try:
-                subtotal = float(m.get('price_raw', 0)) * int(m.get('quantity', 1))
-                m['subtotal'] = subtotal
-                total_cost += subtotal
-            except:
-                m['subtotal'] = 0
+        # ✅ Vectorized subtotals; unparseable price/quantity count as 0
+        count = len(medicines)
+        prices = np.fromiter((_num(m.get('price_raw', 0), float) for m in medicines), dtype=np.float64, count=count)
+        qtys = np.fromiter((_num(m.get('quantity', 1), int) for m in medicines), dtype=np.float64, count=count)
+        subtotals = np.nan_to_num(prices * qtys)
+        total_cost = float(subtotals.sum())
+        for m, subtotal in zip(medicines, subtotals.tolist()):
+            m['subtotal'] = subtotal
 
         rendered_html = render_template(
-            'prescription.html',
+            PRESCRIPTION_TEMPLATE,
             patient_name=patient_name,
             age=age,
             sex=sex,
@@ -191,24 +449,25 @@ def generate_pdf():
             next_appointment=next_appointment,
             current_date=current_date
         )
-
-        css_path = os.path.join(app.root_path, 'static', 'css', 'prescription-style.css')
-        from weasyprint import CSS
+        rendered_html = PDF_UNUSED_ASSETS_RE.sub('', rendered_html)
 
         # ✅ Generate PDF directly in memory (no temp file)
-        pdf_bytes = HTML(string=rendered_html, base_url=request.host_url).write_pdf(
-            stylesheets=[CSS(css_path)]
-        )
-
-        # ✅ Save to MongoDB (Base64 encoded)
-        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
+        pool = get_pdf_pool()
+        try:
+            pdf_bytes = pool.submit(_render_pdf_bytes, rendered_html, request.host_url).result()
+        except BrokenProcessPool:
+            logger.warning("⚠️ PDF worker pool broke; retrying once on a fresh pool")
+            _discard_pdf_pool(pool)
+            pdf_bytes = get_pdf_pool().submit(_render_pdf_bytes, rendered_html, request.host_url).result()
+
+        # ✅ Save to MongoDB (raw BSON binary, written in batches by the pdf-writer thread)
         pdf_doc = {
             "patient_name": patient_name,
             "doctor_name": doctor_name,
             "created_at": datetime.now(),
-            "pdf_data": pdf_base64
+            "pdf_data": Binary(pdf_bytes)
         }
-        pdf_collection.insert_one(pdf_doc)
+        enqueue_pdf_doc(pdf_doc)
 
         # ✅ Return the generated PDF as download
         return send_file(
@@ -224,15 +483,29 @@ def generate_pdf():
 
 @app.route('/get_pdf/<id>')
 def get_pdf(id):
+    # ✅ Stored PDFs never change, so the document id is a stable ETag; revalidation only
+    # needs an _id existence check, not the PDF bytes
+    if id in request.if_none_match:
+        if pdf_collection.find_one({"_id": ObjectId(id)}, {"_id": 1}) is None:
+            return "PDF not found", 404
+        response = Response(status=304)
+        response.set_etag(id)
+        response.cache_control.no_cache = True
+        return response
+
     record = pdf_collection.find_one({"_id": ObjectId(id)})
     if not record:
         return "PDF not found", 404
 
-    pdf_data = base64.b64decode(record['pdf_data'])
+    pdf_data = record['pdf_data']
+    if isinstance(pdf_data, str):  # older documents stored Base64 text
+        pdf_data = base64.b64decode(pdf_data)
     return send_file(
-    io.BytesIO(pdf_data),
-    mimetype='application/pdf',
-    as_attachment=False
+        io.BytesIO(pdf_data),
+        mimetype='application/pdf',
+        as_attachment=False,
+        conditional=True,
+        etag=id
     )
 
 
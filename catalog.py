@@ -0,0 +1,85 @@
+import os
+import logging
+import tempfile
+import pandas as pd
+
+# -------------------------
+# Medicine catalogue: load + clean medicines.csv (no Flask/MongoDB/WeasyPrint needed,
+# so the cache can be built at image build time: `python catalog.py`)
+# -------------------------
+logger = logging.getLogger(__name__)
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "medicines.csv")
+
+# ✅ The only CSV columns the app reads; extend this when new code needs another field
+MEDICINE_COLUMNS = ['Medicine Name', 'Type', 'Brand', 'Strength', 'Generic', 'Price']
+
+# ✅ Bump whenever _clean_catalog() changes so stale cache files are never reused
+CATALOG_VERSION = 2
+
+
+def _clean_catalog(csv_path):
+    df = pd.read_csv(csv_path, usecols=MEDICINE_COLUMNS)
+
+    # ✅ Clean Price (handles various messy formats)
+    # ✅ Keep only the leading number, which also fixes multi-dot values like "10.256.00"
+    df['Price_Clean'] = pd.to_numeric(
+        df['Price']
+        .astype(str)
+        .str.replace(r'.*?:\s*৳\s*', '', regex=True)
+        .str.replace(r'[^\d\.]', '', regex=True)
+        .str.extract(r'^(\d*\.?\d*)', expand=False),
+        errors='coerce'
+    ).fillna(0.0)
+
+    # ✅ Drop rows with missing Strength
+    df_cleaned = df.dropna(subset=['Strength']).copy()
+
+    # ✅ Normalize text columns
+    df_cleaned['Generic_Clean'] = df_cleaned['Generic'].astype(str).str.strip().str.lower()
+    df_cleaned['Strength'] = df_cleaned['Strength'].astype(str).str.strip()
+    df_cleaned['Type'] = df_cleaned['Type'].astype(str).str.strip()
+
+    # ✅ Low-cardinality lookup keys as categoricals (small int codes, less memory)
+    for col in ('Generic_Clean', 'Strength', 'Type'):
+        df_cleaned[col] = df_cleaned[col].astype('category')
+
+    # ✅ Raw Price/Generic are fully replaced by Price_Clean/Generic_Clean; don't keep them resident
+    return df_cleaned.drop(columns=['Price', 'Generic'])
+
+
+def load_catalog(csv_path):
+    """Read and clean medicines.csv, memoized as a pickle keyed by the CSV, cleaning and pandas versions."""
+    stat = os.stat(csv_path)
+    cache_path = (
+        f"{os.path.splitext(csv_path)[0]}.v{CATALOG_VERSION}-pandas{pd.__version__}"
+        f"-{stat.st_mtime_ns}-{stat.st_size}.pkl"
+    )
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_pickle(cache_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable catalog cache {cache_path}: {e}")
+
+    df_cleaned = _clean_catalog(csv_path)
+
+    # ✅ Later cold starts skip parsing/cleaning; written to a temp file and renamed so
+    # readers never see a partial pickle. A failed write only costs this speed-up.
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            df_cleaned.to_pickle(f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"⚠️ Could not write catalog cache {cache_path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df_cleaned
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    catalog = load_catalog(CSV_PATH)
+    logger.info(f"✅ Catalog cache ready ({len(catalog)} medicines).")
@@ -20,7 +20,7 @@ function fetchDependentOptions(e){
   if(changed==='generic_name'){ clearSelect(strength); clearSelect(type); }
   if(changed==='strength') clearSelect(type);
   if(!generic) return;
-  fetch('/get_options',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({generic})})
+  fetch('/get_options?'+new URLSearchParams({generic}))
   .then(r=>r.json()).then(d=>{
     if(changed==='generic_name') d.strengths.forEach(s=>addOption(strength,s,s));
     if(d.types) d.types.forEach(t=>addOption(type,t,t));
@@ -32,7 +32,7 @@ function fetchMedicineOptions(){
   const strength=document.getElementById('strength').value;
   const type=document.getElementById('type').value;
   if(!generic||!strength||!type) return;
-  fetch('/get_details',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({generic,strength,type})})
+  fetch('/get_details?'+new URLSearchParams({generic,strength,type}))
   .then(r=>r.json()).then(d=>renderMedicineTable(d.options));
 }
 